@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import setup, find_packages
 
 setup(name='tfe_hardware',
       version='0.0.1',
@@ -7,5 +7,5 @@ setup(name='tfe_hardware',
       author='Wolfgang Pfaff',
       author_email='wolfgangpfff@gmail.com',
       license='MIT',
-      packages=['tfe_hardware'],
+      packages=find_packages(),
       zip_safe=False)
@@ -6,14 +6,9 @@
 #YR: also, here is keysights manual,http://ena.support.keysight.com/e5071c/manuals/webhelp/eng/
 #you want the programming -> remote control part for VISA commands
 
-import visa
-import types
 import logging
 import numpy as np
-import time
-from qcodes import (Instrument, VisaInstrument,
-                    ManualParameter, MultiParameter,
-                    validators as vals)
+from qcodes import (VisaInstrument, validators as vals)
 #from pyvisa.visa_exceptions import VisaIOError
 #triggered=[False]*159 
 
@@ -38,8 +33,13 @@ class Agilent_ENA_5071C(VisaInstrument):
         '''
         if address == None: 
             raise Exception('TCP IP address needed')
-        logging.info(__name__ + ' : Initializing instrument Agilent_E5071C')
+        logging.info('%s : Initializing instrument Agilent_E5071C', __name__)
+        # data transfer format found at connect, restored on close
+        self._prev_data_format = None
+        self._prev_byte_order = None
         super().__init__(name, address, terminator = '\n', **kwargs)
+        # power sweep axis, cleared whenever one of its inputs is set
+        self._pdata_cache = None
 
         # Add in parameters
         self.add_parameter('fstart', 
@@ -81,7 +81,8 @@ class Agilent_ENA_5071C(VisaInstrument):
         self.add_parameter('num_points', 
                            get_cmd = ':SENS1:SWE:POIN?', 
                            set_cmd = ':SENS1:SWE:POIN {}', 
-                           vals = vals.Ints(1,1601), 
+                           set_parser = self._invalidate_pdata,
+                           vals = vals.Ints(1,20001), 
                            get_parser = int
                            )
         self.add_parameter('ifbw', 
@@ -99,6 +100,7 @@ class Agilent_ENA_5071C(VisaInstrument):
         self.add_parameter('power_start',
                            get_cmd = ':SOUR1:POW:STAR?',
                            set_cmd = ':SOUR1:POW:STAR {}',
+                           set_parser = self._invalidate_pdata,
                            unit = 'dBm',
                            get_parser = float, 
                            vals = vals.Numbers(-85, 10)
@@ -106,6 +108,7 @@ class Agilent_ENA_5071C(VisaInstrument):
         self.add_parameter('power_stop', 
                            get_cmd = ':SOUR:POW:STOP?', 
                            set_cmd = ':SOUR1:POW:STOP {}', 
+                           set_parser = self._invalidate_pdata,
                            unit = 'dBm', 
                            get_parser = float, 
                            vals = vals.Numbers(-85, 10)), 
@@ -190,7 +193,72 @@ class Agilent_ENA_5071C(VisaInstrument):
                            get_parser = float,
                            unit = 's'
                            )
+        # transfer all array data as little-endian float64 binary blocks
+        self._prev_data_format = self.ask(':FORM:DATA?')
+        self._prev_byte_order = self.ask(':FORM:BORD?')
+        self.set_binary_format()
+
         self.connect_message()
+
+    def set_binary_format(self):
+        '''
+        Switches array transfers to little-endian REAL,64 binary blocks.
+        Done at connect; call it again after presetting the instrument.
+        '''
+        self.write(':FORM:DATA REAL')
+        self.write(':FORM:BORD SWAP')
+
+    def close(self):
+        '''
+        Restores the data transfer format found at connect, then closes.
+        '''
+        try:
+            # Instrument.close() removes the attributes, so there is nothing to restore on a second call
+            if getattr(self, '_prev_data_format', None) is not None:
+                self.write(':FORM:DATA %s' % self._prev_data_format)
+                self.write(':FORM:BORD %s' % self._prev_byte_order)
+        finally:
+            super().close()
+
+    def _ask_binary(self, cmd):
+        '''
+        Queries an array of doubles transferred as an IEEE-488.2 binary block.
+        '''
+        return self.visa_handle.query_binary_values(cmd, datatype = 'd',
+                                                    is_big_endian = False,
+                                                    container = np.ndarray)
+
+    def _read_binary_block(self, query):
+        '''
+        Reads one IEEE-488.2 definite length block of doubles from the
+        output buffer, leaving anything after it unread.
+        query is only used in the error message.
+        '''
+        header = self.visa_handle.read_bytes(2)
+        if header[0:1] != b'#' or not header[1:2].isdigit() or header[1:2] == b'0':
+            self._binary_block_error(query, 'expected a definite length block header, got %r' % header)
+        length = self.visa_handle.read_bytes(int(header[1:2]))
+        if not length.isdigit():
+            self._binary_block_error(query, 'expected the block length, got %r' % length)
+        n_bytes = int(length)
+        raw = self.visa_handle.read_bytes(n_bytes)
+        return np.frombuffer(raw, dtype = '<f8').copy()
+
+    def _binary_block_error(self, query, reason):
+        '''
+        Clears the output buffer, so the next query does not read the rest
+        of this response, and raises.
+        '''
+        self.device_clear()
+        raise ValueError('%s: unexpected response to %r, %s' % (self.name, query, reason))
+
+    def _invalidate_pdata(self, value):
+        '''
+        set_parser hook for the parameters the power sweep axis depends on.
+        '''
+        self._pdata_cache = None
+        return value
+
     def gettrace(self):
         '''
         Gets amp/phase stimulus data, returns 2 arrays
@@ -200,10 +268,8 @@ class Agilent_ENA_5071C(VisaInstrument):
         Output:
             [[mags (dB)], [phases (rad)]]
         '''
-        strdata= str(self.ask(':CALC:DATA:FDATA?'))
-        data= np.array(list(map(float,strdata.split(','))))
-        data=data.reshape((int(np.size(data)/2)),2)
-        return data.transpose()
+        data = self._ask_binary(':CALC:DATA:FDATA?')
+        return data.reshape(-1, 2).T
     
     def getSweepData(self):
         '''
@@ -218,9 +284,42 @@ class Agilent_ENA_5071C(VisaInstrument):
         Output:
             sweep_values (Hz, dBm, etc...)
         '''
-        logging.info(__name__ + ' : get stim data')
-        strdata= str(self.ask(':SENS1:X:VAL?'))
-        return np.array(list(map(float,strdata.split(','))))
+        logging.info('%s : get stim data', __name__)
+        return self._ask_binary(':SENS1:X:VAL?')
+
+    def getpdata(self):
+        '''
+        Gets the power values of a power sweep, returns array
+        The values are computed from power_start, power_stop and num_points
+        and cached until one of them is set through this driver.
+
+        Input:
+            None
+        Output:
+            powers (dBm)
+        '''
+        logging.info('%s : get p stim data', __name__)
+        if self._pdata_cache is None:
+            self._pdata_cache = np.linspace(self.power_start(), self.power_stop(),
+                                            self.num_points.get_latest())
+        return self._pdata_cache.copy()
+
+    def get_trace_with_axis(self):
+        '''
+        Gets the sweep values and the amp/phase data with a single compound
+        query, so both come from the same sweep.
 
-            
-        
\ No newline at end of file
+        Input:
+            None
+        Output:
+            sweep_values, [[mags (dB)], [phases (rad)]]
+        '''
+        query = ':SENS1:X:VAL?;:CALC:DATA:FDATA?'
+        self.write(query)
+        sweep_values = self._read_binary_block(query)
+        separator = self.visa_handle.read_bytes(1)
+        if separator != b';':
+            self._binary_block_error(query, "expected ';' between the two responses, got %r" % separator)
+        data = self._read_binary_block(query)
+        self.visa_handle.read_bytes(1)  # message terminator
+        return sweep_values, data.reshape(-1, 2).T
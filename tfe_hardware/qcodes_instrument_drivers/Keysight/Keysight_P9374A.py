@@ -7,12 +7,17 @@ A driver to control the Keysight VNA P9374A using pyVISA and qcodes
 """
 
 import logging
-from typing import Any, Union, Dict, List, Tuple
+import re
+import time
+from typing import Any, Dict, List, Tuple
 
 import numpy as np
 from qcodes import (VisaInstrument, Parameter, ParameterWithSetpoints, InstrumentChannel, validators as vals)
 from qcodes.instrument.parameter import ParamRawDataType
 
+# one catalog entry: "<measurement name ending in _number>,<parameter>"
+_TRACE_CATALOG_RE = re.compile(r'[^,]*_(\d+),([^,]+)')
+
 """
 Some basic concepts for this VNA:
 
@@ -70,6 +75,7 @@ class SParameterData(Parameter):
             return 'Trace is not on'
 
         self.root_instrument.write(f":CALC1:MEAS{self.trace_number}:PAR {S_parameter}")
+        self.root_instrument.invalidate_traces_cache()
 
 
 class FrequencyData(Parameter):
@@ -88,8 +94,7 @@ class FrequencyData(Parameter):
         if self.instrument.npts() == 0 or self.trace_number not in traces:
             return np.array([])
 
-        data = self.root_instrument.ask(f"CALC:MEAS{self.trace_number}:X?")
-        return np.array(data.split(',')).astype(float)
+        return self.root_instrument._ask_binary(f"CALC:MEAS{self.trace_number}:X?")
 
 
 class TraceData(ParameterWithSetpoints):
@@ -100,6 +105,11 @@ class TraceData(ParameterWithSetpoints):
     VNA will be set to polar format "POL" to acquire data by default.
     If the VNA is in a different measurement format, it will be reset to that format after measurement, other wise VNA
     will remain in format of self.data_fmt after the measurement.
+    Set self.restore_format to False to leave the VNA in self.data_fmt, which saves the format writes on every call.
+
+    The measurement format is only queried the first time, after that the last format set through this parameter is
+    assumed. The driver forgets it when trform is set or traces are added/removed; set self.current_fmt to None if
+    the format was changed on the VNA software in between.
 
     """
 
@@ -107,6 +117,8 @@ class TraceData(ParameterWithSetpoints):
         super().__init__(*args, **kwargs)
         self.trace_number = trace_number
         self.data_fmt = "POL"
+        self.restore_format = True
+        self.current_fmt = None
 
     def get_raw(self) -> ParamRawDataType:
         _, traces, _ = self.root_instrument.get_existing_traces()
@@ -116,26 +128,31 @@ class TraceData(ParameterWithSetpoints):
         # get the values of relevant parameters before taking the trace
         prev_fmt = None
         if self.data_fmt is not None:
-            prev_fmt = self.root_instrument.ask(f"CALC:MEAS{self.trace_number}:FORM?")
-            self.root_instrument.write(f"CALC:MEAS{self.trace_number}:FORM {self.data_fmt}")
+            if self.current_fmt is None:
+                self.current_fmt = self.root_instrument.ask(f"CALC:MEAS{self.trace_number}:FORM?")
+            if self.current_fmt != self.data_fmt:
+                if self.restore_format:
+                    prev_fmt = self.current_fmt
+                self.root_instrument.write(f"CALC:MEAS{self.trace_number}:FORM {self.data_fmt}")
+                self.current_fmt = self.data_fmt
 
         # Code will check if VNA average trpe is SWEEP.
         # If not a type error will be raised.
         try:
             prev_trigger_source, prev_sweep_mode, prev_averaging = self.root_instrument.average()
-            data = self.root_instrument.ask(f"CALC:MEAS{self.trace_number}:DATA:FDATA?")
+            data = self.root_instrument._ask_binary(f"CALC:MEAS{self.trace_number}:DATA:FDATA?")
             # set relevant parameters back to their old values
             self.root_instrument.trigger_source(prev_trigger_source)
             self.root_instrument.sweep_mode(prev_sweep_mode)
             self.root_instrument.averaging(prev_averaging)
             if prev_fmt is not None:
                 self.root_instrument.write(f"CALC:MEAS{self.trace_number}:FORM {prev_fmt}")
+                self.current_fmt = prev_fmt
 
             # process complex data correctly
-            data = np.array(data.split(',')).astype(float)
             if self.data_fmt in ['POL'] and data.size % 2 == 0:
-                data = data.reshape((int(data.size / 2), 2))
-                data = data[:, 0] + 1j * data[:, 1]
+                # (re, im) pairs are already laid out like complex128
+                data = data.view(np.complex128)
             return data
 
         except Exception as e:
@@ -153,6 +170,8 @@ class Trace(InstrumentChannel):
 
     def __init__(self, parent: "Keysight_P9374A_SingleChannel", number: int, name: str, **kwargs: Any):
         self._number = number
+        # last number of points read from the VNA, used for validating the shape of the data arrays
+        self._npts_cached = 0
         super().__init__(parent, name=name, **kwargs)
 
         self.add_parameter(
@@ -167,7 +186,7 @@ class Trace(InstrumentChannel):
             unit='Hz',
             parameter_class=FrequencyData,
             trace_number=self._number,
-            vals=vals.Arrays(shape=(self.npts.get_latest,)),
+            vals=vals.Arrays(shape=(self._get_npts_cached,)),
             snapshot_exclude=True,
         )
 
@@ -177,7 +196,7 @@ class Trace(InstrumentChannel):
             setpoints=(self.frequency,),
             parameter_class=TraceData,
             trace_number=self._number,
-            vals=vals.Arrays(shape=(self.npts.get_latest,),
+            vals=vals.Arrays(shape=(self._get_npts_cached,),
                              valid_types=(np.floating, np.complexfloating)),
             snapshot_exclude = True,
         )
@@ -192,14 +211,19 @@ class Trace(InstrumentChannel):
         )
 
     def _get_npts(self):
-        return len(self._get_xdata())
+        self._npts_cached = len(self._get_xdata())
+        return self._npts_cached
+
+    def _get_npts_cached(self) -> int:
+        # shared by the frequency and data validators: ParameterWithSetpoints compares their shapes with ==,
+        # which holds for bound methods of the same object but not for two separate lambdas
+        return self._npts_cached
 
     def _get_xdata(self) -> np.ndarray:
         _, traces, _ = self.root_instrument.get_existing_traces()
         if self._number not in traces:
             return np.array([])
-        data = self.ask(f"CALC:MEAS{self._number}:X?")
-        return np.array(data.split(',')).astype(float)
+        return self.root_instrument._ask_binary(f"CALC:MEAS{self._number}:X?")
 
 
 class Keysight_P9374A_SingleChannel(VisaInstrument):
@@ -223,12 +247,27 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
         """
         if address is None:
             raise Exception('TCP IP address needed')
-        logging.info(__name__ + ' : Initializing instrument Keysight PNA')
+        logging.info('%s : Initializing instrument Keysight PNA', __name__)
+
+        # data transfer format found at connect, restored on close
+        self._prev_data_format = None
+        self._prev_byte_order = None
+
+        # trace catalog is re-read at most once per _traces_cache_ttl seconds
+        self._traces_cache = None
+        self._traces_cache_time = 0.
+        self._traces_cache_ttl = 0.5
 
         super().__init__(name, address, terminator='\n', **kwargs)
 
         self.write('CALC1:PAR:MNUM 1')  # sets the active msmt to the first channel/trace
 
+        # transfer all array data as little-endian float64 binary blocks
+        self._prev_data_format = self.ask('FORM:DATA?')
+        self._prev_byte_order = self.ask('FORM:BORD?')
+        self.write('FORM:DATA REAL,64')
+        self.write('FORM:BORD SWAP')
+
         # Add in parameters
         self.add_parameter('fstart',
                            get_cmd=':SENS1:FREQ:STAR?',
@@ -353,6 +392,7 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
         self.add_parameter('trform',
                            get_cmd=':CALC1:FORM?',
                            set_cmd=':CALC1:FORM {}',
+                           set_parser=self._invalidate_trace_formats,
                            vals=vals.Enum('MLOG', 'PHAS',
                                           'GDEL',
                                           'SCOM', 'SMIT', 'SADM',
@@ -392,9 +432,44 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
 
         self.connect_message()
 
+    def close(self) -> None:
+        """Restore the data transfer format found at connect, then close."""
+        try:
+            # Instrument.close() removes the attributes, so there is nothing to restore on a second call
+            if getattr(self, '_prev_data_format', None) is not None:
+                self.write(f'FORM:DATA {self._prev_data_format}')
+                self.write(f'FORM:BORD {self._prev_byte_order}')
+        finally:
+            super().close()
+
+    def _ask_binary(self, cmd: str) -> np.ndarray:
+        """Query an array of float64 values transferred as an IEEE 488.2 binary block."""
+        return self.visa_handle.query_binary_values(cmd, datatype='d', is_big_endian=False,
+                                                    container=np.ndarray)
+
     def clear_all_traces(self):
         """remove all currently defined traces."""
         self.write("CALC:MEAS:DEL:ALL")
+        self.invalidate_traces_cache()
+        self._invalidate_trace_formats()
+
+    def invalidate_traces_cache(self) -> None:
+        """Force the next trace lookup to query the instrument.
+
+        Only needed if traces were changed outside of this driver (e.g., on the VNA software) within the
+        last _traces_cache_ttl seconds.
+        """
+        self._traces_cache = None
+
+    def _invalidate_trace_formats(self, value=None):
+        """
+        Forget the measurement format remembered by the data parameter of every trace, so that it is queried again.
+        Also used as set_parser of trform, which changes the format of the active measurement.
+        """
+        for submodule in self.submodules.values():
+            if isinstance(submodule, Trace):
+                submodule.data.current_fmt = None
+        return value
 
     def get_existing_traces_by_channel(self) -> Dict[int, List[Tuple[int, str]]]:
         """Returns all currently available traces.
@@ -404,19 +479,27 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
         Returns
             A dictionary, with keys being the channel indices that have traces in them.
             values are tuples of trace/measurement number and parameter measured.
+
+        The result is cached for a short time (_traces_cache_ttl), since the parameters of every trace
+        look it up before talking to the instrument. A copy is returned, so the cache cannot be changed by the caller.
         """
+        return {chan: list(traces) for chan, traces in self._get_traces_cached().items()}
+
+    def _get_traces_cached(self) -> Dict[int, List[Tuple[int, str]]]:
+        """get_existing_traces_by_channel without the copy; the result must not be modified."""
+        now = time.monotonic()
+        if self._traces_cache is not None and now - self._traces_cache_time < self._traces_cache_ttl:
+            return self._traces_cache
+
         ret = {}
         for i in range(1, 9):
             traces = self.ask(f"CALC{i}:PAR:CAT:EXT?").strip('"')
             if traces == "NO CATALOG":
                 continue
-            else:
-                ret[i] = []
-            traces = traces.split(',')
-            names = traces[::2]
-            params = traces[1::2]
-            for n, p in zip(names, params):
-                ret[i].append((int(n.split('_')[-1]), p))
+            ret[i] = [(int(m.group(1)), m.group(2)) for m in _TRACE_CATALOG_RE.finditer(traces)]
+
+        self._traces_cache = ret
+        self._traces_cache_time = now
         return ret
 
     def get_existing_traces(self) -> Tuple[List[int], List[int], List[str]]:
@@ -424,7 +507,7 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
         Return three lists, with one item per current trace: channel, trace/measurement number, parameter
         """
         chans, numbers, params = [], [], []
-        trace_dict = self.get_existing_traces_by_channel()
+        trace_dict = self._get_traces_cached()
         for chan, traces in trace_dict.items():
             for number, param in traces:
                 chans.append(chan)
@@ -445,15 +528,14 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
         Output:
             sweep_values (Hz, dBm, etc...)
         """
-        logging.info(__name__ + ' : get stim data')
-        strdata = str(self.ask(':SENS1:X:VAL?'))
-        return np.array(list(map(float, strdata.split(','))))
+        logging.info('%s : get stim data', __name__)
+        return self._ask_binary(':SENS1:X:VAL?')
 
     def data_to_mem(self):
         """
         Calls for data to be stored in memory
         """
-        logging.debug(__name__ + ": data to mem called")
+        logging.debug("%s: data to mem called", __name__)
         self.write(":CALC1:MATH:MEM")
 
     def remove_trace(self, number: int):
@@ -466,8 +548,10 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
         if number not in traces:
             print('Trace does not exist. Nothing happens.')
         else:
-            logging.debug(__name__ + f": remove trace{number}")
+            logging.debug("%s: remove trace%s", __name__, number)
             self.write(f"CALC1:MEAS{number}:DEL")
+            self.invalidate_traces_cache()
+            self._invalidate_trace_formats()
             print('Trace is successfully removed.')
 
     def add_trace(self, number: int = 1, s_parameter: str = "S21"):
@@ -480,9 +564,11 @@ class Keysight_P9374A_SingleChannel(VisaInstrument):
         if number in traces:
             print('Trace exist. Please use another trace number or remove the current one with remove_trace(number).')
         else:
-            logging.debug(__name__ + f": add trace{number} with S-parameter {s_parameter}")
-            self.write(f"CALC1:MEAS{number}:DEF '{s_parameter}'")
-            self.write(f"DISP:MEAS{number}:FEED 1")  # always show this trace in the window 1 (FEED number).
+            logging.debug("%s: add trace%s with S-parameter %s", __name__, number, s_parameter)
+            # define the measurement and always show it in the window 1 (FEED number), in one message.
+            self.write(f"CALC1:MEAS{number}:DEF '{s_parameter}';:DISP:MEAS{number}:FEED 1")
+            self.invalidate_traces_cache()
+            self._invalidate_trace_formats()
             print('Trace is successfully created.')
 
     # TODO: add timout protection
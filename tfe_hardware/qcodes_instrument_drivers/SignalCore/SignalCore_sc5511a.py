@@ -10,7 +10,10 @@ A simple driver for SignalCore SC5511A to be used with QCoDes, transferred from
 import ctypes
 import platform
 import logging
-from typing import Any, Dict, Optional, List
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, List
 
 from qcodes import (Instrument, validators as vals)
 from qcodes.utils.validators import Numbers
@@ -75,6 +78,8 @@ class List_mode_t(ctypes.Structure):
 
 
 class Device_status_t(ctypes.Structure):
+    # the fields of the nested structures can be read directly, e.g. status.rf1_out_enable
+    _anonymous_ = ("list_mode", "operate_status_t", "pll_status_t")
     _fields_ = [("list_mode", List_mode_t),
                 ("operate_status_t", Operate_status_t),
                 ("pll_status_t", Pll_status_t)]
@@ -89,6 +94,45 @@ class Device_info_t(ctypes.Structure):
 
 
 # End of Structures------------------------------------------------------------
+
+# restype and argtypes of the DLL functions we use, so that ctypes does not have to guess the conversions on each call
+_DLL_PROTOTYPES = {
+    'sc5511a_open_device': (ctypes.c_uint64, [ctypes.c_char_p]),
+    'sc5511a_close_device': (ctypes.c_int, [ctypes.c_void_p]),
+    'sc5511a_set_freq': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ulonglong]),
+    'sc5511a_set_level': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_float]),
+    'sc5511a_set_output': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ubyte]),
+    'sc5511a_set_rf_mode': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ubyte]),
+    'sc5511a_set_clock_reference': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ubyte, ctypes.c_ubyte]),
+    'sc5511a_set_auto_level_disable': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ubyte]),
+    'sc5511a_list_start_freq': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ulonglong]),
+    'sc5511a_list_stop_freq': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ulonglong]),
+    'sc5511a_list_step_freq': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_ulonglong]),
+    'sc5511a_list_dwell_time': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_uint]),
+    'sc5511a_list_cycle_count': (ctypes.c_int, [ctypes.c_void_p, ctypes.c_uint]),
+    'sc5511a_list_mode_config': (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(List_mode_t)]),
+    'sc5511a_list_soft_trigger': (ctypes.c_int, [ctypes.c_void_p]),
+    'sc5511a_get_rf_parameters': (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(Device_rf_params_t)]),
+    'sc5511a_get_device_status': (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(Device_status_t)]),
+    'sc5511a_get_temperature': (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(Device_temperature_t)]),
+    'sc5511a_get_device_info': (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(Device_info_t)]),
+}
+
+
+def _configure_dll(dll: ctypes.CDLL) -> None:
+    """
+    Set restype and argtypes of the SC5511A functions on a freshly loaded DLL.
+    Functions missing from the DLL (older API versions) are skipped.
+    """
+    for func_name, (restype, argtypes) in _DLL_PROTOTYPES.items():
+        try:
+            func = getattr(dll, func_name)
+        except AttributeError:
+            continue
+        func.restype = restype
+        func.argtypes = argtypes
+
+
 class SignalCore_SC5511A(Instrument):
 
     if platform.system() == 'Windows':
@@ -100,7 +144,7 @@ class SignalCore_SC5511A(Instrument):
                  dllpath: Optional[str] = None, debug=False, **kwargs: Any):
         super().__init__(name, **kwargs)
 
-        logging.info(__name__ + f' : Initializing instrument SignalCore generator {serial_number}')
+        logging.info('%s : Initializing instrument SignalCore generator %s', __name__, serial_number)
         if dllpath is not None:
             self._dll = ctypes.CDLL(dllpath)
         else:
@@ -109,26 +153,39 @@ class SignalCore_SC5511A(Instrument):
         if debug:
             print(self._dll)
 
-        self._dll.sc5511a_open_device.restype = ctypes.c_uint64
+        _configure_dll(self._dll)
         self._handle = ctypes.c_void_p(
             self._dll.sc5511a_open_device(ctypes.c_char_p(bytes(serial_number, 'utf-8'))))
         self._serial_number = ctypes.c_char_p(bytes(serial_number, 'utf-8'))
         self._rf_params = Device_rf_params_t(0, 0, 0, 0, 0, 0, 0, 0, 0)
         self._status = Operate_status_t(0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-        self._open = False
+        self._open = True
+        # guards opening and closing the handle; _refcount counts the DLL calls in progress (see _device)
+        self._lock = threading.Lock()
+        self._refcount = 0
+        self._keep_open = True
         self._temperature = Device_temperature_t(0)
 
         self._pll_status = Pll_status_t()
         self._list_mode = List_mode_t()
         self._device_status = Device_status_t(self._list_mode, self._status, self._pll_status)
+        # the structures live as long as the instrument, so their byref arguments are built only once
+        self._rf_params_ref = ctypes.byref(self._rf_params)
+        self._temperature_ref = ctypes.byref(self._temperature)
+        self._status_ref = ctypes.byref(self._device_status)
+        self._list_mode_ref = ctypes.byref(self._device_status.list_mode)
+        # status (and RF parameter) reads within _status_ttl seconds of each other share one DLL call
+        self._status_ttl = 0.01
+        self._status_cached_at = 0.
+        self._rf_params_cached_at = 0.
         if debug:
             print(serial_number, self._handle)
-            self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-            status = self._device_status.operate_status_t.rf1_out_enable
+            self._refresh_status(force=True)
+            status = self._device_status.rf1_out_enable
             print('check status', status)
 
-        self._dll.sc5511a_close_device(self._handle)
         self._device_info = Device_info_t(0, 0, 0, 0)
+        self._device_info_ref = ctypes.byref(self._device_info)
         self.get_idn()
         self.do_set_auto_level_disable(0)  # setting this to 1 will lead to unstable output power
 
@@ -302,7 +359,7 @@ class SignalCore_SC5511A(Instrument):
                            unit="C",
                            vals=Numbers(min_value=0, max_value=200))
 
-        if self._device_status.operate_status_t.ext_ref_lock_enable == 0:
+        if self.do_get_reference_source() == 0:
             self.do_set_reference_source(1)
 
     @classmethod
@@ -329,37 +386,135 @@ class SignalCore_SC5511A(Instrument):
         n_gens_found = search(mem)
         return [sn.decode('utf-8') for sn in mem[:n_gens_found]]
 
+    def close(self) -> None:
+        """
+        Release the device handle, then close the instrument
+        """
+        try:
+            # Instrument.close() removes the attributes, so there is nothing to release on a second call
+            if getattr(self, '_lock', None) is not None:
+                self.set_open(False)
+        finally:
+            super().close()
+
     def set_open(self, open) -> bool:
-        if open and not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            self._open = True
-        elif not open and self._open:
-            self._dll.sc5511a_close_device(self._handle)
-            self._open = False
+        """
+        Open or release the device handle. Calling it again with the same value does nothing.
+        Releasing the handle while another thread is talking to the device is deferred until that call is done.
+        """
+        with self._lock:
+            self._keep_open = bool(open)
+            if open and not self._open:
+                self._open_handle()
+            elif not open and self._open and self._refcount == 0:
+                self._close_handle()
         return True
 
+    def _open_handle(self) -> None:
+        # must be called with self._lock held
+        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
+        self._open = True
+
+    def _close_handle(self) -> None:
+        # must be called with self._lock held
+        self._dll.sc5511a_close_device(self._handle)
+        self._open = False
+
+    @contextmanager
+    def _device(self) -> Iterator[None]:
+        """
+        Make sure the device handle is open for the DLL calls inside the with block, and that no other thread closes
+        it in the meantime. If the handle was released with set_open(False), it is only open for the block.
+        """
+        with self._lock:
+            if not self._open:
+                self._open_handle()
+            self._refcount += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._refcount -= 1
+                if self._refcount == 0 and self._open and not self._keep_open:
+                    self._close_handle()
+
+    def _refresh_status(self, force: bool = False) -> None:
+        """
+        Read the device status into self._device_status, unless it was read less than self._status_ttl seconds ago.
+        Use force=True before modifying and writing back part of the status.
+        """
+        now = time.monotonic()
+        if force or now - self._status_cached_at > self._status_ttl:
+            with self._device():
+                self._dll.sc5511a_get_device_status(self._handle, self._status_ref)
+            self._status_cached_at = now
+
+    def _refresh_rf_params(self) -> None:
+        """
+        Read the RF parameters into self._rf_params, unless they were read less than self._status_ttl seconds ago.
+        """
+        now = time.monotonic()
+        if now - self._rf_params_cached_at > self._status_ttl:
+            with self._device():
+                self._dll.sc5511a_get_rf_parameters(self._handle, self._rf_params_ref)
+            self._rf_params_cached_at = now
+
     def soft_trigger(self) -> None:
         """
         Send out a soft trigger, so that the we can start the sweep
         Generator need to be configured for list mode and soft trigger is selected as the trigger source
         """
-        logging.info(__name__ + ' : Send a soft trigger to the generator')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_list_soft_trigger(self._handle)
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Send a soft trigger to the generator', __name__)
+        with self._device():
+            self._dll.sc5511a_list_soft_trigger(self._handle)
         return None
 
+    def program_list_sweep(self, start: float, stop: float, step: float, dwell: int, cycles: int = 1) -> None:
+        """
+        Program a hardware-timed frequency sweep, so that the generator steps through the frequencies by itself
+        instead of us setting every point.
+        The generator is put in sweep mode (sss_mode = 1) and rf1_mode = 1; start the sweep with soft_trigger()
+        (or a hardware trigger if hw_trigger is 1), and use wait_list_done() to wait for it to finish.
+            Args:
+                start, stop, step (float) = sweep frequencies in Hz
+                dwell (int) = time at each point, as multiple of 500 us
+                cycles (int) = number of sweep cycles, 0 to repeat continuously
+        """
+        logging.info('%s : Programming sweep from %s to %s in steps of %s', __name__, start, stop, step)
+        # go through the parameters, so that the values are validated and their caches stay up to date
+        with self._device():
+            self.sweep_start_frequency(start)
+            self.sweep_stop_frequency(stop)
+            self.sweep_step_frequency(step)
+            self.sweep_dwell_time(dwell)
+            self.sweep_cycles(cycles)
+            self.sss_mode(1)
+            self.rf1_mode(1)
+
+    def wait_list_done(self, timeout: Optional[float] = None, poll_interval: float = 0.01) -> bool:
+        """
+        Wait until the sweep/list started after program_list_sweep() is no longer running.
+        Returns False if it is still running after timeout seconds, True otherwise.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._refresh_status(force=True)
+            if not self._device_status.list_mode_running:
+                return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(poll_interval)
+
     def do_set_output_status(self, enable) -> None:
         """
         Turns the output of RF1 on or off.
             Input:
                 enable (int) = OFF = 0 ; ON = 1
         """
-        logging.info(__name__ + ' : Setting output to %s' % enable)
-        c_enable = ctypes.c_ubyte(enable)
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        completed = self._dll.sc5511a_set_output(self._handle, c_enable)
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting output to %s', __name__, enable)
+        with self._device():
+            completed = self._dll.sc5511a_set_output(self._handle, enable)
+        self._status_cached_at = 0.
         return completed
 
     def do_get_output_status(self) -> int:
@@ -368,26 +523,19 @@ class SignalCore_SC5511A(Instrument):
             Output:
                 status (int) : OFF = 0 ; ON = 1
         """
-        logging.info(__name__ + ' : Getting output')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        status = self._device_status.operate_status_t.rf1_out_enable
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting output', __name__)
+        self._refresh_status()
+        status = self._device_status.rf1_out_enable
         return status
 
     def do_set_sweep_start_frequency(self, sweep_start_frequency) -> None:
         """
         Set the sweep start frequency of RF1 in the unit of Hz
         """
-        c_sweep_start_freq = ctypes.c_ulonglong(int(sweep_start_frequency))
-        logging.info(__name__ + ' : Setting sweep start frequency to %s' % sweep_start_frequency)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        if_set = self._dll.sc5511a_list_start_freq(self._handle, c_sweep_start_freq)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep start frequency to %s', __name__, sweep_start_frequency)
+        with self._device():
+            if_set = self._dll.sc5511a_list_start_freq(self._handle, int(sweep_start_frequency))
+        self._rf_params_cached_at = 0.
         return if_set
 
     def do_get_sweep_start_frequency(self) -> float:
@@ -395,26 +543,19 @@ class SignalCore_SC5511A(Instrument):
         Get the sweep start frequency that is used in the sweep mode
         The frequency returned is in the unit of Hz
         """
-        logging.info(__name__ + 'Getting sweep start frequency')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_rf_parameters(self._handle, ctypes.byref(self._rf_params))
+        logging.info('%s : Getting sweep start frequency', __name__)
+        self._refresh_rf_params()
         sweep_start_frequency = self._rf_params.start_freq
-        self._dll.sc5511a_close_device(self._handle)
         return sweep_start_frequency
 
     def do_set_sweep_stop_frequency(self, sweep_stop_frequency) -> None:
         """
         Set the sweep stop frequency of RF1 in the unit of Hz
         """
-        c_sweep_stop_frequency = ctypes.c_ulonglong(int(sweep_stop_frequency))
-        logging.info(__name__ + ' : Setting sweep stop frequency to %s' % sweep_stop_frequency)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        if_set = self._dll.sc5511a_list_stop_freq(self._handle, c_sweep_stop_frequency)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep stop frequency to %s', __name__, sweep_stop_frequency)
+        with self._device():
+            if_set = self._dll.sc5511a_list_stop_freq(self._handle, int(sweep_stop_frequency))
+        self._rf_params_cached_at = 0.
         return if_set
 
     def do_get_sweep_stop_frequency(self) -> float:
@@ -422,26 +563,19 @@ class SignalCore_SC5511A(Instrument):
         Get the sweep stop frequency that is used in the sweep mode
         The frequency returned is in the unit of Hz
         """
-        logging.info(__name__ + 'Getting sweep stop frequency')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_rf_parameters(self._handle, ctypes.byref(self._rf_params))
+        logging.info('%s : Getting sweep stop frequency', __name__)
+        self._refresh_rf_params()
         sweep_stop_frequency = self._rf_params.stop_freq
-        self._dll.sc5511a_close_device(self._handle)
         return sweep_stop_frequency
 
     def do_set_sweep_step_frequency(self, sweep_step_frequency) -> None:
         """
         Set the sweep step frequency of RF1 in the unit of Hz
         """
-        c_sweep_step_frequency = ctypes.c_ulonglong(int(sweep_step_frequency))
-        logging.info(__name__ + ' : Setting sweep step frequency to %s' % sweep_step_frequency)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        if_set = self._dll.sc5511a_list_step_freq(self._handle, c_sweep_step_frequency)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep step frequency to %s', __name__, sweep_step_frequency)
+        with self._device():
+            if_set = self._dll.sc5511a_list_step_freq(self._handle, int(sweep_step_frequency))
+        self._rf_params_cached_at = 0.
         return if_set
 
     def do_get_sweep_step_frequency(self) -> float:
@@ -449,11 +583,9 @@ class SignalCore_SC5511A(Instrument):
         Get the sweep step frequency that is used in the sweep mode
         The frequency returned is in the unit of Hz
         """
-        logging.info(__name__ + 'Getting sweep step frequency')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_rf_parameters(self._handle, ctypes.byref(self._rf_params))
+        logging.info('%s : Getting sweep step frequency', __name__)
+        self._refresh_rf_params()
         sweep_step_frequency = self._rf_params.step_freq
-        self._dll.sc5511a_close_device(self._handle)
         return sweep_step_frequency
 
     def do_set_sweep_dwell_time(self, sweep_dwell_time) -> None:
@@ -462,15 +594,10 @@ class SignalCore_SC5511A(Instrument):
         Note that the dwell time is set as multiple of 500 us.
         The input value is an unsigned int, it means how many multiple of 500 us.
         """
-        c_sweep_dwell_time = ctypes.c_uint(int(sweep_dwell_time))
-        logging.info(__name__ + ': Setting sweep dwell time to %s' % sweep_dwell_time)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        if_set = self._dll.sc5511a_list_dwell_time(self._handle, c_sweep_dwell_time)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep dwell time to %s', __name__, sweep_dwell_time)
+        with self._device():
+            if_set = self._dll.sc5511a_list_dwell_time(self._handle, int(sweep_dwell_time))
+        self._rf_params_cached_at = 0.
         return if_set
 
     def do_get_sweep_dwell_time(self) -> int:
@@ -478,11 +605,9 @@ class SignalCore_SC5511A(Instrument):
         Get the dwell time of the sweep mode.
         Return value is the unit multiple of 500 us, e.g. a return value 3 means the dwell time is 1500 us.
         """
-        logging.info(__name__ + 'Getting sweep dwell time in the unit of how many multiple of 500 us')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_rf_parameters(self._handle, ctypes.byref(self._rf_params))
+        logging.info('%s : Getting sweep dwell time in the unit of how many multiple of 500 us', __name__)
+        self._refresh_rf_params()
         sweep_dwell_time = self._rf_params.sweep_dwell_time
-        self._dll.sc5511a_close_device(self._handle)
         return sweep_dwell_time
 
     def do_set_sweep_cycles(self, sweep_cycles) -> None:
@@ -490,15 +615,10 @@ class SignalCore_SC5511A(Instrument):
         Set the number of sweep cycles to perform before stopping.
         To repeat the sweep continuously, set the value to 0.
         """
-        c_sweep_cycles = ctypes.c_uint(int(sweep_cycles))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % sweep_cycles)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        if_set = self._dll.sc5511a_list_cycle_count(self._handle, c_sweep_cycles)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, sweep_cycles)
+        with self._device():
+            if_set = self._dll.sc5511a_list_cycle_count(self._handle, int(sweep_cycles))
+        self._rf_params_cached_at = 0.
         return if_set
 
     def do_get_sweep_cycles(self) -> int:
@@ -506,11 +626,9 @@ class SignalCore_SC5511A(Instrument):
         Get the number of sweep cycles to perform before stopping.
         To repeat the sweep continuously, the value is 0.
         """
-        logging.info(__name__ + 'Getting number of sweep cycles')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_rf_parameters(self._handle, ctypes.byref(self._rf_params))
+        logging.info('%s : Getting number of sweep cycles', __name__)
+        self._refresh_rf_params()
         sweep_cycles = self._rf_params.sweep_cycles
-        self._dll.sc5511a_close_device(self._handle)
         return sweep_cycles
 
     def do_set_trig_out_enable(self, trig_out_enable) -> None:
@@ -520,19 +638,11 @@ class SignalCore_SC5511A(Instrument):
         0 = No trigger output
         1 = Puts a trigger pulse on the TRIGOUT pin
         """
-        c_trig_out_enable = ctypes.c_ubyte(int(trig_out_enable))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % trig_out_enable)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.trig_out_enable = c_trig_out_enable
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, trig_out_enable)
+        self._refresh_status(force=True)
+        self._device_status.trig_out_enable = int(trig_out_enable)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_trig_out_enable(self) -> int:
@@ -541,11 +651,9 @@ class SignalCore_SC5511A(Instrument):
         0 = No trigger output
         1 = Puts a trigger pulse on the TRIGOUT pin
         """
-        logging.info(__name__ + 'Getting trigger output status')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        trig_out_enable = self._device_status.list_mode.trig_out_enable
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting trigger output status', __name__)
+        self._refresh_status()
+        trig_out_enable = self._device_status.trig_out_enable
         return trig_out_enable
 
     def do_set_trig_out_on_cycle(self, trig_out_on_cycle) -> None:
@@ -554,19 +662,11 @@ class SignalCore_SC5511A(Instrument):
         0 = Puts out a trigger pulse at each frequency change
         1 = Puts out a trigger pulse at the completion of each sweep/list cycle
         """
-        c_trig_out_on_cycle = ctypes.c_ubyte(int(trig_out_on_cycle))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % trig_out_on_cycle)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.trig_out_on_cycle = c_trig_out_on_cycle
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, trig_out_on_cycle)
+        self._refresh_status(force=True)
+        self._device_status.trig_out_on_cycle = int(trig_out_on_cycle)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_trig_out_on_cycle(self) -> int:
@@ -575,11 +675,9 @@ class SignalCore_SC5511A(Instrument):
         0 = Puts out a trigger pulse at each frequency change
         1 = Puts out a trigger pulse at the completion of each sweep/list cycle
         """
-        logging.info(__name__ + 'Getting trigger output mode ')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        trig_out_enable = self._device_status.list_mode.trig_out_on_cycle
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting trigger output mode', __name__)
+        self._refresh_status()
+        trig_out_enable = self._device_status.trig_out_on_cycle
         return trig_out_enable
 
     def do_set_step_on_hw_trig(self, step_on_hw_trig) -> None:
@@ -592,19 +690,11 @@ class SignalCore_SC5511A(Instrument):
             frequency on a trigger.Upon completion of the number of cycles, the device will exit from the stepping state
             and stop.
         """
-        c_step_on_hw_trig = ctypes.c_ubyte(int(step_on_hw_trig))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % step_on_hw_trig)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.step_on_hw_trig = c_step_on_hw_trig
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, step_on_hw_trig)
+        self._refresh_status(force=True)
+        self._device_status.step_on_hw_trig = int(step_on_hw_trig)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_step_on_hw_trig(self) -> int:
@@ -613,11 +703,9 @@ class SignalCore_SC5511A(Instrument):
         0 = Start/Stop behavior
         1 = Step-on-trigger
         """
-        logging.info(__name__ + 'Getting status of step on trigger mode ')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        step_on_hw_trig = self._device_status.list_mode.step_on_hw_trig
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting status of step on trigger mode', __name__)
+        self._refresh_status()
+        step_on_hw_trig = self._device_status.step_on_hw_trig
         return step_on_hw_trig
 
     def do_set_return_to_start(self, return_to_start) -> None:
@@ -627,19 +715,11 @@ class SignalCore_SC5511A(Instrument):
         1 = Return to start. The frequency will return and stop at the beginning point of the sweep or list after a
             cycle.
         """
-        c_return_to_start = ctypes.c_ubyte(int(return_to_start))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % return_to_start)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.return_to_start = c_return_to_start
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, return_to_start)
+        self._refresh_status(force=True)
+        self._device_status.return_to_start = int(return_to_start)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_return_to_start(self) -> int:
@@ -649,11 +729,9 @@ class SignalCore_SC5511A(Instrument):
         1 = Return to start. The frequency will return and stop at the beginning point of the sweep or list after a
             cycle.
         """
-        logging.info(__name__ + 'Getting status of return to start ')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        return_to_start = self._device_status.list_mode.return_to_start
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting status of return to start', __name__)
+        self._refresh_status()
+        return_to_start = self._device_status.return_to_start
         return return_to_start
 
     def do_set_hw_trig(self, hw_trigger) -> None:
@@ -664,19 +742,11 @@ class SignalCore_SC5511A(Instrument):
         1 = Hardware trigger. A high-to-low transition on the TRIGIN pin will trigger the device. It can be used for
             both start/stop or step-on-trigger functions.
         """
-        c_hw_trigger = ctypes.c_ubyte(int(hw_trigger))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % hw_trigger)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.hw_trigger = c_hw_trigger
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, hw_trigger)
+        self._refresh_status(force=True)
+        self._device_status.hw_trigger = int(hw_trigger)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_hw_trig(self) -> int:
@@ -687,11 +757,9 @@ class SignalCore_SC5511A(Instrument):
         1 = Hardware trigger. A high-to-low transition on the TRIGIN pin will trigger the device. It can be used for
             both start/stop or step-on-trigger functions.
         """
-        logging.info(__name__ + 'Getting status of hardware trigger ')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        hw_trigger = self._device_status.list_mode.hw_trigger
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting status of hardware trigger', __name__)
+        self._refresh_status()
+        hw_trigger = self._device_status.hw_trigger
         return hw_trigger
 
     def do_set_tri_waveform(self, tri_waveform) -> None:
@@ -701,19 +769,11 @@ class SignalCore_SC5511A(Instrument):
         1 = Triangular waveform. Frequency reverses direction at the end of the list and steps back towards the
             beginning to complete a cycle
         """
-        c_tri_waveform = ctypes.c_ubyte(int(tri_waveform))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % tri_waveform)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.tri_waveform = c_tri_waveform
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, tri_waveform)
+        self._refresh_status(force=True)
+        self._device_status.tri_waveform = int(tri_waveform)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_tri_waveform(self) -> int:
@@ -723,11 +783,9 @@ class SignalCore_SC5511A(Instrument):
         1 = Triangular waveform. Frequency reverses direction at the end of the list and steps back towards the
             beginning to complete a cycle
         """
-        logging.info(__name__ + 'Getting status of triangular waveform ')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        hw_trigger = self._device_status.list_mode.tri_waveform
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting status of triangular waveform', __name__)
+        self._refresh_status()
+        hw_trigger = self._device_status.tri_waveform
         return hw_trigger
 
     def do_set_sweep_dir(self, sweep_dir) -> None:
@@ -737,19 +795,11 @@ class SignalCore_SC5511A(Instrument):
         1 = Reverse. Sweeps start from the stop frequency and steps down toward the start frequency or starts at the
             end and steps toward the beginning of the buffer
         """
-        c_sweep_dir = ctypes.c_ubyte(int(sweep_dir))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % sweep_dir)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.sweep_dir = c_sweep_dir
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, sweep_dir)
+        self._refresh_status(force=True)
+        self._device_status.sweep_dir = int(sweep_dir)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_sweep_dir(self) -> int:
@@ -759,11 +809,9 @@ class SignalCore_SC5511A(Instrument):
         1 = Reverse. Sweeps start from the stop frequency and steps down toward the start frequency or starts at the
             end and steps toward the beginning of the buffer
         """
-        logging.info(__name__ + 'Getting status of sweep direction ')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        hw_trigger = self._device_status.list_mode.sweep_dir
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting status of sweep direction', __name__)
+        self._refresh_status()
+        hw_trigger = self._device_status.sweep_dir
         return hw_trigger
 
     def do_set_sss_mode(self, sss_mode) -> None:
@@ -772,19 +820,11 @@ class SignalCore_SC5511A(Instrument):
         0 = List mode. Device gets its frequency points from the list buffer uploaded via LIST_BUFFER_WRITE register
         1 = Sweep mode. The device computes the frequency points using the Start, Stop and Step frequencies
         """
-        c_sss_mode = ctypes.c_ubyte(int(sss_mode))
-        logging.info(__name__ + ': Setting sweep cycle number to %s ' % sss_mode)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        self._device_status.list_mode.sss_mode = c_sss_mode
-        if_set = self._dll.sc5511a_list_mode_config(self._handle, ctypes.byref(self._device_status.list_mode))
-
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting sweep cycle number to %s', __name__, sss_mode)
+        self._refresh_status(force=True)
+        self._device_status.sss_mode = int(sss_mode)
+        with self._device():
+            if_set = self._dll.sc5511a_list_mode_config(self._handle, self._list_mode_ref)
         return if_set
 
     def do_get_sss_mode(self) -> int:
@@ -793,11 +833,9 @@ class SignalCore_SC5511A(Instrument):
         0 = List mode. Device gets its frequency points from the list buffer uploaded via LIST_BUFFER_WRITE register
         1 = Sweep mode. The device computes the frequency points using the Start, Stop and Step frequencies
         """
-        logging.info(__name__ + 'Getting status of sss mode')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        sss_mode = self._device_status.list_mode.sss_mode
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting status of sss mode', __name__)
+        self._refresh_status()
+        sss_mode = self._device_status.sss_mode
         return sss_mode
 
     def do_set_rf1_mode(self, rf1_mode) -> None:
@@ -806,15 +844,10 @@ class SignalCore_SC5511A(Instrument):
         0 = single fixed tone mode
         1 = sweep/list mode
         """
-        c_rf1_mode = ctypes.c_ubyte(rf1_mode)
-        logging.info(__name__ + ' : Setting frequency to %s' % rf1_mode)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        if_set = self._dll.sc5511a_set_rf_mode(self._handle, c_rf1_mode)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting frequency to %s', __name__, rf1_mode)
+        with self._device():
+            if_set = self._dll.sc5511a_set_rf_mode(self._handle, rf1_mode)
+        self._status_cached_at = 0.
         return if_set
 
     def do_get_rf1_mode(self) -> int:
@@ -823,11 +856,9 @@ class SignalCore_SC5511A(Instrument):
         0 = single fixed tone mode
         1 = sweep/list mode
         """
-        logging.info(__name__ + 'Getting the RF mode for rf1')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        rf1_mode = self._device_status.operate_status_t.rf1_mode
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting the RF mode for rf1', __name__)
+        self._refresh_status()
+        rf1_mode = self._device_status.rf1_mode
         return rf1_mode
 
     def do_set_frequency(self, frequency) -> None:
@@ -836,26 +867,19 @@ class SignalCore_SC5511A(Instrument):
             Args:
                 frequency (int) = frequency in Hz
         """
-        c_freq = ctypes.c_ulonglong(int(frequency))
-        logging.info(__name__ + ' : Setting frequency to %s' % frequency)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        if_set = self._dll.sc5511a_set_freq(self._handle, c_freq)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting frequency to %s', __name__, frequency)
+        with self._device():
+            if_set = self._dll.sc5511a_set_freq(self._handle, int(frequency))
+        self._rf_params_cached_at = 0.
         return if_set
 
     def do_get_frequency(self) -> float:
         """
         Gets RF1 frequency in the unit of Hz.
         """
-        logging.info(__name__ + ' : Getting frequency')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_rf_parameters(self._handle, ctypes.byref(self._rf_params))
+        logging.info('%s : Getting frequency', __name__)
+        self._refresh_rf_params()
         frequency = self._rf_params.rf1_freq
-        self._dll.sc5511a_close_device(self._handle)
         return frequency
 
     def do_set_reference_source(self, lock_to_external) -> None:
@@ -866,12 +890,11 @@ class SignalCore_SC5511A(Instrument):
 
         Note here high is set to 0, means we always use 10 MHz clock when use external lock
         """
-        logging.info(__name__ + ' : Setting reference source to %s' % lock_to_external)
-        high = ctypes.c_ubyte(0)
-        lock = ctypes.c_ubyte(lock_to_external)
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        source = self._dll.sc5511a_set_clock_reference(self._handle, high, lock)
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting reference source to %s', __name__, lock_to_external)
+        high = 0
+        with self._device():
+            source = self._dll.sc5511a_set_clock_reference(self._handle, high, lock_to_external)
+        self._status_cached_at = 0.
         return source
 
     def do_get_reference_source(self) -> int:
@@ -880,95 +903,74 @@ class SignalCore_SC5511A(Instrument):
         0 = internal source
         1 = external source
         """
-        logging.info(__name__ + ' : Getting reference source')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        enabled = self._device_status.operate_status_t.ext_ref_lock_enable
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Getting reference source', __name__)
+        self._refresh_status()
+        enabled = self._device_status.ext_ref_lock_enable
         return enabled
 
     def do_set_power(self, power) -> None:
         """
         Set the power of the generator in the unit of dBm
         """
-        logging.info(__name__ + ' : Setting power to %s' % power)
-        c_power = ctypes.c_float(power)
-        close = False
-        if not self._open:
-            self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-            close = True
-        completed = self._dll.sc5511a_set_level(self._handle, c_power)
-        if close:
-            self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting power to %s', __name__, power)
+        with self._device():
+            completed = self._dll.sc5511a_set_level(self._handle, power)
+        self._rf_params_cached_at = 0.
         return completed
 
     def do_get_power(self) -> float:
         """
         Get the power of the generator in the unit of dBm
         """
-        logging.info(__name__ + ' : Getting Power')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_rf_parameters(self._handle, ctypes.byref(self._rf_params))
+        logging.info('%s : Getting Power', __name__)
+        self._refresh_rf_params()
         rf_level = self._rf_params.rf_level
-        self._dll.sc5511a_close_device(self._handle)
         return rf_level
 
     def do_set_auto_level_disable(self, enable) -> None:
         """
         Set if we want to disable the auto level
         """
-        logging.info(__name__ + ' : Settingalc auto to %s' % enable)
-        if enable == 1:
-            enable = 0
-        elif enable == 0:
-            enable = 1
-        c_enable = ctypes.c_ubyte(enable)
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        completed = self._dll.sc5511a_set_auto_level_disable(self._handle, c_enable)
-        self._dll.sc5511a_close_device(self._handle)
+        logging.info('%s : Setting alc auto to %s', __name__, enable)
+        # the DLL flag is inverted with respect to the parameter
+        with self._device():
+            completed = self._dll.sc5511a_set_auto_level_disable(self._handle, int(enable) ^ 1)
+        self._status_cached_at = 0.
         return completed
 
     def do_get_auto_level_disable(self) -> int:
         """
         Get if we disable to auto level
         """
-        logging.info(__name__ + ' : Getting alc auto status')
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_status(self._handle, ctypes.byref(self._device_status))
-        enabled = self._device_status.operate_status_t.auto_pwr_disable
-        self._dll.sc5511a_close_device(self._handle)
-        if enabled == 1:
-            enabled = 0
-        elif enabled == 0:
-            enabled = 1
-        return enabled
+        logging.info('%s : Getting alc auto status', __name__)
+        self._refresh_status()
+        return self._device_status.auto_pwr_disable ^ 1
 
     def do_get_device_temp(self)  -> float:
         """
         Get the device temperature in unit of C
         """
-        logging.info(__name__ + " : Getting device temperature")
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_temperature(self._handle, ctypes.byref(self._temperature))
+        logging.info('%s : Getting device temperature', __name__)
+        with self._device():
+            self._dll.sc5511a_get_temperature(self._handle, self._temperature_ref)
         device_temp = self._temperature.device_temp
-        self._dll.sc5511a_close_device(self._handle)
         return device_temp
 
     def get_idn(self) -> Dict[str, Optional[str]]:
         """
         Get the identification information of the current device
         """
-        logging.info(__name__ + " : Getting device info")
-        self._handle = ctypes.c_void_p(self._dll.sc5511a_open_device(self._serial_number))
-        self._dll.sc5511a_get_device_info(self._handle, ctypes.byref(self._device_info))
+        logging.info('%s : Getting device info', __name__)
+        with self._device():
+            self._dll.sc5511a_get_device_info(self._handle, self._device_info_ref)
         device_info = self._device_info
-        self._dll.sc5511a_close_device(self._handle)
 
         def date_decode(date_int: int):
-            date_str = f"{date_int:032b}"
-            yr = f"20{int(date_str[:8], 2)}"
-            month = f"{int(date_str[16:24], 2)}"
-            day = f"{int(date_str[8:16], 2)}"
-            return f"{month}/{day}/{yr}"
+            # bytes from the top: year (since 2000), day, month
+            yr = (date_int >> 24) & 0xFF
+            day = (date_int >> 16) & 0xFF
+            month = (date_int >> 8) & 0xFF
+            return f"{month}/{day}/20{yr:02d}"
 
         IDN: Dict[str, Optional[str]] = {
             'vendor': "SignalCore",
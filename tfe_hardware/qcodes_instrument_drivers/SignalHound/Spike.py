@@ -100,10 +100,10 @@ class Spike(VisaInstrument):
         self.mode('ZS')
 
     def _measure_zs_iq_vals(self):
-        IQ_table = np.array(self.ask(':FETCH:ZS? 1').split(',')).astype(float).reshape(-1, 2)
+        IQ_table = np.fromstring(self.ask(':FETCH:ZS? 1'), dtype=np.float64, sep=',').reshape(-1, 2)
         return IQ_table
 
     def _measure_zs_power_dBm(self):
-        IQ_table = np.array(self.ask(':FETCH:ZS? 1').split(',')).astype(float).reshape(-1, 2)
+        IQ_table = np.fromstring(self.ask(':FETCH:ZS? 1'), dtype=np.float64, sep=',').reshape(-1, 2)
         power = (IQ_table[:, 0] ** 2 + IQ_table[:, 1] ** 2).mean()
         return 10 * np.log10(power)
\ No newline at end of file
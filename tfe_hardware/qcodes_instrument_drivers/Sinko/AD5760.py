@@ -5,10 +5,10 @@ A simple driver to control the AD5760 current source
 __author__ = "Kaushik Singirikonda"
 __email__ = 'ks105@illinois.edu'
 
-from functools import partial
+from functools import partial, lru_cache
 from typing import Optional, Union, Any
 import time,sys
-import clr  # install pythonnet
+import numpy as np
 
 from qcodes.instrument.parameter import DelegateParameter
 from qcodes import (Instrument, validators as vals)
@@ -26,8 +26,30 @@ Following this, you can simply run this code to operate a stable current source.
 '''
 
 
+@lru_cache(maxsize=1)
+def _bootstrap_clr(syspath: str):
+    '''
+    Loads the ACE remoting assemblies through pythonnet and returns their ClientManager.
+    Cached, so that only the first board connected in a session pays for starting the CLR.
+    '''
+    import clr  # install pythonnet
+
+    sys.path.append(rf'{syspath}')
+    clr.AddReference('AnalogDevices.Csa.Remoting.Clients')
+    clr.AddReference('AnalogDevices.Csa.Remoting.Contracts')
+
+    from AnalogDevices.Csa.Remoting.Clients import ClientManager
+    return ClientManager
+
+
 class AD5760(Instrument):
 
+    # conversion between volts and register codes, see write() and ask()
+    _OFFSET_W = 10
+    _SCALE_W = 65536/20
+    _OFFSET_R = 524288
+    _SCALE_R = 20/1048576
+
     def __init__(self, name: str, host_name: str, path: str, syspath: str, terminator: str = "\n",
                  **kwargs: Any) -> None:
         
@@ -92,12 +114,7 @@ class AD5760(Instrument):
     
     def connect_board(self, host_name: str, path: str, syspath: str):
         
-        sys.path.append(rf'{syspath}')
-
-        clr.AddReference('AnalogDevices.Csa.Remoting.Clients')
-        clr.AddReference('AnalogDevices.Csa.Remoting.Contracts')
-        
-        from AnalogDevices.Csa.Remoting.Clients import ClientManager  
+        ClientManager = _bootstrap_clr(syspath)
         manager = ClientManager.Create(-1)
         self.client = manager.CreateRequestClient(f"localhost:{host_name}")
         self.client.ContextPath = path
@@ -164,21 +181,24 @@ class AD5760(Instrument):
 
 
     def ramp_trial(self, ramp_to: float, step: float, delay: float):
-        
+        """
+        Ramp the output from the current level to ramp_to in steps no larger than step,
+        ending exactly on ramp_to.
+        """
         v_in = self.voltage()
-        v_f = v_in
-        if ramp_to > v_in:
-            num_steps = (ramp_to - v_in)/step +1
-            for i in range(int(num_steps+1)):
-                v_f += step
-                self.voltage(v_f)
-                time.sleep(delay)
-        elif ramp_to < v_in:
-            num_steps = - (ramp_to - v_in)/step 
-            for i in range(int(num_steps+1)):
-                v_f -= step
-                self.voltage(v_f)
-                time.sleep(delay) 
+        if ramp_to == v_in:
+            return
+        num_steps = int(np.ceil(abs(ramp_to - v_in)/step))
+        # steps are scheduled delay apart, so the time spent setting the voltage does not add up over the ramp.
+        # After a write slower than delay the schedule restarts from now instead of catching up, so a stall shortens
+        # at most one wait and the following steps are again delay apart (delay limits the slew rate).
+        deadline = time.monotonic()
+        for v_f in np.linspace(v_in, ramp_to, num_steps + 1)[1:]:
+            self.voltage(float(v_f))
+            deadline = max(deadline + delay, time.monotonic())
+            sleep_for = deadline - time.monotonic()
+            if sleep_for > 0:
+                time.sleep(sleep_for)
 
 
     def _get_volt(self):
@@ -200,9 +220,9 @@ class AD5760(Instrument):
 
         524288 and 65536 are the conversion factors from the board output to volts.
         '''
-        return (float(int(self.client.ReadRegister("1"), 16))-524288)*20/1048576
+        return (int(self.client.ReadRegister("1"), 16) - self._OFFSET_R)*self._SCALE_R
     
     def write(self, output_level):
-        output_conv = int((output_level + 10)*65536/20)
+        output_conv = int((output_level + self._OFFSET_W)*self._SCALE_W)
         self.client.WriteRegister("1", str(output_conv))
         